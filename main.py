@@ -1,8 +1,16 @@
+import os
+
+# Persist numba-compiled librosa kernels between runs (must be set before importing librosa)
+os.environ.setdefault("NUMBA_CACHE_DIR", ".numba_cache")
+
 import pygame
 import librosa
 import numpy as np
 import random
 import json
+import tempfile
+import threading
+import zipfile
 from collections import deque
 
 pygame.init()
@@ -10,138 +18,150 @@ WIDTH, HEIGHT = 600, 800
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("Music Visualizer Game")
 
+BEATS_CACHE = "beats_cache.npz"
+BEAT_SR = 11025  # Beat tracking doesn't need more bandwidth than this
+BEAT_HOP = 256  # Same ~23 ms hop as 512 at 22050 Hz (the default n_fft=2048 window is twice as long in time)
+
 FONT = pygame.font.SysFont("Arial", 32)
 BIG_FONT = pygame.font.SysFont("Arial", 48)
 SMALL_FONT = pygame.font.SysFont("Arial", 24)
 
 
 # ============================
-# LINKED LIST (Notes)
+# Text Rendering Cache
 # ============================
-class NoteNode:
-    def __init__(self, x, y, lane, duration, note_type="normal"):
-        self.x = x
-        self.y = y
-        self.lane = lane
-        self.duration = duration
-        self.note_type = note_type  # "normal", "long"
-        self.is_holding = False
-        self.hold_start_y = None
-        self.next = None
-
-
-class NoteLinkedList:
-    def __init__(self):
-        self.head = None
-
-    def add(self, x, y, lane, duration, note_type="normal"):
-        new = NoteNode(x, y, lane, duration, note_type)
-        if self.head is None:
-            self.head = new
-        else:
-            cur = self.head
-            while cur.next:
-                cur = cur.next
-            cur.next = new
-
-    def remove(self, node):
-        if self.head == node:
-            self.head = self.head.next
-            return
-        cur = self.head
-        while cur and cur.next != node:
-            cur = cur.next
-        if cur and cur.next:
-            cur.next = cur.next.next
-
-    def __iter__(self):
-        cur = self.head
-        while cur:
-            yield cur
-            cur = cur.next
+text_cache = {}
 
 
-# ============================
-# BINARY SEARCH TREE for High Scores
-# (Nonlinear Data Structure)
-# ============================
-class ScoreNode:
-    def __init__(self, song, score):
-        self.song = song
-        self.score = score
-        self.left = None
-        self.right = None
-
+def render_text(font, text, color):
+    # Rendering text is expensive, so reuse the surface while the text is unchanged
+    key = (font, text, color)
+    surf = text_cache.get(key)
+    if surf is None:
+        surf = font.render(text, True, color)
+        text_cache[key] = surf
+    return surf
 
-class ScoreBST:
-    def __init__(self):
-        self.root = None
-
-    def insert(self, song, score):
-        if self.root is None:
-            self.root = ScoreNode(song, score)
-        else:
-            self._insert_recursive(self.root, song, score)
 
-    def _insert_recursive(self, node, song, score):
-        if song < node.song:
-            if node.left is None:
-                node.left = ScoreNode(song, score)
-            else:
-                self._insert_recursive(node.left, song, score)
-        elif song > node.song:
-            if node.right is None:
-                node.right = ScoreNode(song, score)
-            else:
-                self._insert_recursive(node.right, song, score)
-        else:
-            node.score = max(node.score, score)
-
-    def search(self, song):
-        return self._search_recursive(self.root, song)
-
-    def _search_recursive(self, node, song):
-        if node is None:
-            return 0
-        if song == node.song:
-            return node.score
-        elif song < node.song:
-            return self._search_recursive(node.left, song)
-        else:
-            return self._search_recursive(node.right, song)
-
-    def inorder_traversal(self):
-        result = []
-        self._inorder_recursive(self.root, result)
-        return result
-
-    def _inorder_recursive(self, node, result):
-        if node:
-            self._inorder_recursive(node.left, result)
-            result.append((node.song, node.score))
-            self._inorder_recursive(node.right, result)
+# ============================
+# STRUCT OF ARRAYS (Notes)
+# ============================
+class NoteArrays:
+    def __init__(self, capacity=256):
+        # Parallel buffers, one slot per note; only [:count] is live
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.count = 0
+
+    def add(self, x, y):
+        if self.count == len(self.y):
+            self._grow()
+        n = self.count
+        self.x[n] = x
+        self.y[n] = y
+        self.count += 1
+
+    def _grow(self):
+        self.x = np.concatenate((self.x, np.zeros_like(self.x)))
+        self.y = np.concatenate((self.y, np.zeros_like(self.y)))
+
+    def fall(self, speed):
+        self.y[:self.count] += speed
+
+    def remove(self, index):
+        # Shift the tail down one slot so spawn order is kept
+        n = self.count
+        self.x[index:n - 1] = self.x[index + 1:n]
+        self.y[index:n - 1] = self.y[index + 1:n]
+        self.count -= 1
+
+    def remove_where(self, mask):
+        # mask covers the live slots; surviving notes are compacted to the front
+        keep = ~mask
+        n = int(np.count_nonzero(keep))
+        self.x[:n] = self.x[:self.count][keep]
+        self.y[:n] = self.y[:self.count][keep]
+        self.count = n
+
+    def __len__(self):
+        return self.count
 
 
 # ============================
-# Explosion Particle
+# Explosion Particles (struct of arrays)
 # ============================
-class Particle:
-    def __init__(self, x, y, color=(255, 255, 255)):
-        self.x = x
-        self.y = y
-        self.vx = random.uniform(-3, 3)
-        self.vy = random.uniform(-3, 3)
-        self.life = random.randint(10, 20)
-        self.color = color
+class ParticleArrays:
+    def __init__(self, capacity=512):
+        # Parallel buffers, one slot per particle; only [:count] is live
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.vx = np.zeros(capacity, dtype=np.float32)
+        self.vy = np.zeros(capacity, dtype=np.float32)
+        self.life = np.zeros(capacity, dtype=np.int32)
+        self.sprite = np.zeros(capacity, dtype=np.int32)
+        self.count = 0
+
+        # One prerendered dot per color, indexed by self.sprite
+        self.sprites = []
+        self.sprite_index = {}
+        self.rng = np.random.default_rng()
+
+    def _grow(self):
+        self.x = np.concatenate((self.x, np.zeros_like(self.x)))
+        self.y = np.concatenate((self.y, np.zeros_like(self.y)))
+        self.vx = np.concatenate((self.vx, np.zeros_like(self.vx)))
+        self.vy = np.concatenate((self.vy, np.zeros_like(self.vy)))
+        self.life = np.concatenate((self.life, np.zeros_like(self.life)))
+        self.sprite = np.concatenate((self.sprite, np.zeros_like(self.sprite)))
+
+    def _get_sprite(self, color):
+        index = self.sprite_index.get(color)
+        if index is None:
+            surf = pygame.Surface((7, 7), pygame.SRCALPHA)
+            pygame.draw.circle(surf, color, (3, 3), 3)
+            index = len(self.sprites)
+            self.sprites.append(surf.convert_alpha())
+            self.sprite_index[color] = index
+        return index
+
+    def spawn(self, x, y, color, amount):
+        while self.count + amount > len(self.x):
+            self._grow()
+        start, end = self.count, self.count + amount
+        self.x[start:end] = x
+        self.y[start:end] = y
+        self.vx[start:end] = self.rng.uniform(-3, 3, amount)
+        self.vy[start:end] = self.rng.uniform(-3, 3, amount)
+        self.life[start:end] = self.rng.integers(10, 21, amount)
+        self.sprite[start:end] = self._get_sprite(color)
+        self.count = end
 
     def update(self):
-        self.x += self.vx
-        self.y += self.vy
-        self.life -= 1
+        n = self.count
+        self.x[:n] += self.vx[:n]
+        self.y[:n] += self.vy[:n]
+        self.life[:n] -= 1
+
+        # Compact the survivors to the front
+        alive = self.life[:n] > 0
+        if not alive.all():
+            m = int(np.count_nonzero(alive))
+            self.x[:m] = self.x[:n][alive]
+            self.y[:m] = self.y[:n][alive]
+            self.vx[:m] = self.vx[:n][alive]
+            self.vy[:m] = self.vy[:n][alive]
+            self.life[:m] = self.life[:n][alive]
+            self.sprite[:m] = self.sprite[:n][alive]
+            self.count = m
 
     def draw(self):
-        if self.life > 0:
-            pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), 3)
+        # Returns the rects touched this frame for dirty-rect display updates
+        n = self.count
+        xs = self.x[:n].astype(np.int32).tolist()
+        ys = self.y[:n].astype(np.int32).tolist()
+        sprites = self.sprites
+        return [screen.blit(sprites[sprite], (x - 3, y - 3))
+                for x, y, sprite in zip(xs, ys, self.sprite[:n].tolist())]
 
 
 # ============================
@@ -163,8 +183,9 @@ class FeedbackText:
     def draw(self):
         if self.life > 0:
             alpha = min(255, self.life * 8)
-            txt = self.font.render(self.text, True, self.color)
-            screen.blit(txt, (self.x - txt.get_width() // 2, self.y))
+            txt = render_text(self.font, self.text, self.color)
+            return screen.blit(txt, (self.x - txt.get_width() // 2, self.y))
+        return None
 
 
 # ============================
@@ -188,11 +209,9 @@ class ApproachCircle:
 # ============================
 # Load music + beat detection
 # ============================
-def load_beats(path):
-    y, sr = librosa.load(path)
-
+def track_beats(y, sr):
     # Use onset detection for more accurate rhythm tracking
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=BEAT_HOP)
 
     # Detect beats with better parameters
     tempo, beats = librosa.beat.beat_track(
@@ -201,63 +220,146 @@ def load_beats(path):
         sr=sr,
         start_bpm=120,
         units='frames',
-        hop_length=512,
+        hop_length=BEAT_HOP,
         tightness=200  # Very strict beat tracking
     )
 
-    beat_times = librosa.frames_to_time(beats, sr=sr, hop_length=512)
+    return beats
+
+
+def analyze_beats(path):
+    y, sr = librosa.load(path, sr=BEAT_SR, mono=True, dtype=np.float32)
+    beats = track_beats(y, sr)
+    beat_times = librosa.frames_to_time(beats, sr=sr, hop_length=BEAT_HOP)
+
+    return beat_times
+
+
+def warm_up_beat_tracking():
+    # Run the pipeline once on a short noise clip so numba compiles its kernels
+    # before the first song is picked (zeros would skip beat tracking entirely)
+    sr = BEAT_SR
+    y = np.random.default_rng(0).standard_normal(2 * sr).astype(np.float32)
+    track_beats(y, sr)
+
+
+def save_beats_cache(cache):
+    # Write to a temp file next to the cache and swap it in, so an interrupted
+    # write never leaves a truncated beats_cache.npz behind
+    cache_dir = os.path.dirname(os.path.abspath(BEATS_CACHE))
+    fd, tmp_path = tempfile.mkstemp(prefix="beats_cache.", suffix=".tmp", dir=cache_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **cache)
+        os.replace(tmp_path, BEATS_CACHE)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def load_beats(path):
+    # Beat times only depend on the file and analysis settings, so cache them keyed by those
+    key = f"{path}:{os.path.getmtime(path)}:{BEAT_SR}:{BEAT_HOP}"
+
+    cache = {}
+    try:
+        with np.load(BEATS_CACHE) as data:
+            cache = {name: data[name] for name in data.files}
+    except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+        # Missing or damaged cache, fall back to analysis and rewrite it
+        cache = {}
+
+    if key in cache:
+        return cache[key]
+
+    beat_times = analyze_beats(path).astype(np.float32)
+
+    # Drop stale entries for this song before writing the new one
+    cache = {name: times for name, times in cache.items() if not name.startswith(f"{path}:")}
+    cache[key] = beat_times
+    save_beats_cache(cache)
 
     return beat_times
 
 
 # ============================
-# High Score System with BST
+# High Score System
 # ============================
 def load_scores():
-    bst = ScoreBST()
     try:
         with open("scores.json", "r") as f:
-            data = json.load(f)
-            for song, score in data.items():
-                bst.insert(song, score)
+            scores = json.load(f)
     except:
-        bst.insert("song.mp3", 0)
-        bst.insert("song1.mp3", 0)
-        bst.insert("song2.mp3", 0)
-    return bst
+        scores = {"song.mp3": 0, "song1.mp3": 0, "song2.mp3": 0}
+    return scores
 
 
-def save_scores(bst):
-    scores = {}
-    for song, score in bst.inorder_traversal():
-        scores[song] = score
+def save_scores(scores):
     with open("scores.json", "w") as f:
         json.dump(scores, f, indent=4)
 
 
+# ============================
+# Backgrounds (loaded once at startup)
+# ============================
+BG_PATHS = {
+    "song.mp3": "background.png",
+    "song1.mp3": "background1.png",
+    "song2.mp3": "background2.png",
+}
+
+
+def load_background(song_path):
+    # Load background depending on song
+    bg_path = BG_PATHS.get(song_path)
+    if bg_path is None:
+        return None
+    try:
+        background = pygame.image.load(bg_path).convert()
+    except:
+        return None
+
+    # Scale once here so the per-frame blit is a straight copy
+    if background.get_size() != (WIDTH, HEIGHT):
+        background = pygame.transform.scale(background, (WIDTH, HEIGHT))
+    return background
+
+
+BACKGROUNDS = {song: load_background(song) for song in BG_PATHS}
+
+
 # ============================
 # Menu Screen
 # ============================
-def song_menu(score_bst):
+def song_menu(scores):
+    # Everything on this screen is static until a song is picked, so render it once
+    title = render_text(BIG_FONT, "Select a Song", (255, 255, 255))
+    title_pos = (WIDTH // 2 - title.get_width() // 2, 80)
+
+    options = ["song.mp3", "song1.mp3", "song2.mp3"]
+    entries = []
+    y = 250
+    for song in options:
+        high_score = scores.get(song, 0)
+        text = render_text(FONT, f"{song}", (255, 255, 0))
+        score_text = render_text(SMALL_FONT, f"Best: {high_score}", (150, 150, 150))
+
+        rect = text.get_rect(center=(WIDTH // 2, y))
+        score_pos = (WIDTH // 2 - score_text.get_width() // 2, y + 30)
+        entries.append((song, text, rect, score_text, score_pos))
+        y += 120
+
     running = True
     while running:
         screen.fill((20, 20, 20))
+        screen.blit(title, title_pos)
 
-        title = BIG_FONT.render("Select a Song", True, (255, 255, 255))
-        screen.blit(title, (WIDTH // 2 - title.get_width() // 2, 80))
-
-        options = ["song.mp3", "song1.mp3", "song2.mp3"]
-        y = 250
         mouse = pygame.mouse.get_pos()
         click = pygame.mouse.get_pressed()[0]
 
-        for song in options:
-            high_score = score_bst.search(song)
-            text = FONT.render(f"{song}", True, (255, 255, 0))
-            score_text = SMALL_FONT.render(f"Best: {high_score}", True, (150, 150, 150))
-
-            rect = text.get_rect(center=(WIDTH // 2, y))
-
+        for song, text, rect, score_text, score_pos in entries:
             # Highlight
             if rect.collidepoint(mouse):
                 pygame.draw.rect(screen, (70, 70, 70), rect.inflate(40, 40))
@@ -266,8 +368,7 @@ def song_menu(score_bst):
                     return song
 
             screen.blit(text, rect)
-            screen.blit(score_text, (WIDTH // 2 - score_text.get_width() // 2, y + 30))
-            y += 120
+            screen.blit(score_text, score_pos)
 
         pygame.display.update()
         for e in pygame.event.get():
@@ -278,32 +379,31 @@ def song_menu(score_bst):
 # ============================
 # Main Game
 # ============================
-def game(song_path, score_bst):
-    # Load background depending on song
-    try:
-        if song_path == "song.mp3":
-            background = pygame.image.load("background.png").convert()
-        elif song_path == "song1.mp3":
-            background = pygame.image.load("background1.png").convert()
-        elif song_path == "song2.mp3":
-            background = pygame.image.load("background2.png").convert()
-        else:
-            background = None
-    except:
-        background = None
+def game(song_path, scores):
+    # Detect beats in the background while the countdown runs
+    beat_result = {}
 
-    # Load beats
-    beat_times = load_beats(song_path)
-    beat_queue = deque(beat_times)
+    def beat_worker():
+        # Hand any failure back to the main thread instead of dying with a thread traceback
+        try:
+            beat_result["beats"] = load_beats(song_path)
+        except Exception as e:
+            beat_result["error"] = e
+
+    beat_thread = threading.Thread(target=beat_worker, daemon=True)
+    beat_thread.start()
+
+    # Background was loaded and scaled at startup
+    background = BACKGROUNDS.get(song_path)
 
     # Start audio
     pygame.mixer.music.load(song_path)
 
-    # Notes list
-    notes = NoteLinkedList()
+    # Notes (struct of arrays), bucketed by lane so each bucket stays in spawn order
+    lane_notes = [NoteArrays() for _ in range(4)]
 
     # Particles
-    particles = []
+    particles = ParticleArrays()
     feedback_texts = []
 
     # 4 Lanes
@@ -311,6 +411,20 @@ def game(song_path, score_bst):
     lane_colors = [(255, 50, 50), (50, 255, 50), (50, 50, 255), (255, 255, 50)]
     lane_flash = [0, 0, 0, 0]
 
+    # Prerender one rounded note per lane color so drawing is a plain blit
+    note_surfaces = []
+    for color in lane_colors:
+        surf = pygame.Surface((80, 80), pygame.SRCALPHA)
+        pygame.draw.rect(surf, color, surf.get_rect(), border_radius=5)
+        note_surfaces.append(surf.convert_alpha())
+
+    # Lane flash overlays, only their alpha changes per frame
+    lane_flash_surfaces = []
+    for color in lane_colors:
+        surf = pygame.Surface((100, HEIGHT)).convert()
+        surf.fill(color)
+        lane_flash_surfaces.append(surf)
+
     # 4 keys for 4 lanes
     keys = {pygame.K_a: 0, pygame.K_s: 1, pygame.K_j: 2, pygame.K_k: 3}
 
@@ -331,24 +445,42 @@ def game(song_path, score_bst):
     judgement_line = HEIGHT - 150
     hit_window = 60
 
-    # Countdown
+    # Lane separators and judgement line never move, so draw them once onto a
+    # per-game copy of the background and blit that as the playfield each frame
+    if background:
+        playfield = background.copy()
+    else:
+        playfield = pygame.Surface((WIDTH, HEIGHT)).convert()
+        playfield.fill((0, 0, 0))
+    for i in range(5):
+        x = i * 150
+        pygame.draw.line(playfield, (100, 100, 100), (x, 0), (x, HEIGHT), 2)
+    pygame.draw.line(playfield, (255, 255, 255), (0, judgement_line), (WIDTH, judgement_line), 4)
+
+    # Countdown, one prerendered frame per second indexed by elapsed time
+    countdown_surfaces = [render_text(BIG_FONT, text, color) for text, color in
+                          [("3", (255, 255, 255)), ("2", (255, 255, 255)),
+                           ("1", (255, 255, 255)), ("GO!", (0, 255, 0))]]
+    loading_surface = render_text(SMALL_FONT, "Analyzing beats...", (200, 200, 200))
+
     countdown_active = True
     countdown_start = pygame.time.get_ticks()
 
     while countdown_active:
         screen.fill((0, 0, 0))
-        elapsed = (pygame.time.get_ticks() - countdown_start) / 1000.0
-
-        if elapsed < 1:
-            text = BIG_FONT.render("3", True, (255, 255, 255))
-        elif elapsed < 2:
-            text = BIG_FONT.render("2", True, (255, 255, 255))
-        elif elapsed < 3:
-            text = BIG_FONT.render("1", True, (255, 255, 255))
-        elif elapsed < 4:
-            text = BIG_FONT.render("GO!", True, (0, 255, 0))
+        step = int((pygame.time.get_ticks() - countdown_start) / 1000.0)
+
+        if step < len(countdown_surfaces):
+            text = countdown_surfaces[step]
+        elif beat_thread.is_alive():
+            # Analysis is taking longer than the countdown, keep the window responsive
+            text = loading_surface
         else:
             countdown_active = False
+            beat_thread.join()
+            if "error" in beat_result:
+                raise beat_result["error"]
+            beat_queue = deque(beat_result["beats"])
             pygame.mixer.music.play()
             start_time = pygame.time.get_ticks() / 1000.0
             break
@@ -362,102 +494,102 @@ def game(song_path, score_bst):
 
         clock.tick(60)
 
+    # Only areas drawn this frame or last frame can change, so only those are sent to the
+    # display. Everything is repainted after the countdown and when coming back from pause.
+    prev_dirty = []
+    full_redraw = True
+
     while running:
         dt = clock.tick(60)
 
+        # Drain the event queue once per frame, both the paused and playing paths use it
+        events = pygame.event.get()
+
         if paused:
             screen.fill((0, 0, 0, 128))
-            pause_text = BIG_FONT.render("PAUSED", True, (255, 255, 255))
+            pause_text = render_text(BIG_FONT, "PAUSED", (255, 255, 255))
             screen.blit(pause_text, (WIDTH // 2 - pause_text.get_width() // 2, HEIGHT // 2 - 50))
-            continue_text = SMALL_FONT.render("Press ESC to continue", True, (200, 200, 200))
+            continue_text = render_text(SMALL_FONT, "Press ESC to continue", (200, 200, 200))
             screen.blit(continue_text, (WIDTH // 2 - continue_text.get_width() // 2, HEIGHT // 2 + 20))
-            exit_text = SMALL_FONT.render("Press Q to quit to menu", True, (200, 200, 200))
+            exit_text = render_text(SMALL_FONT, "Press Q to quit to menu", (200, 200, 200))
             screen.blit(exit_text, (WIDTH // 2 - exit_text.get_width() // 2, HEIGHT // 2 + 50))
 
             pygame.display.update()
 
-            for e in pygame.event.get():
+            for e in events:
                 if e.type == pygame.QUIT:
                     exit()
                 if e.type == pygame.KEYDOWN:
                     if e.key == pygame.K_ESCAPE:
                         paused = False
+                        full_redraw = True
                         pygame.mixer.music.unpause()
                     elif e.key == pygame.K_q:
                         pygame.mixer.music.stop()
+                        text_cache.clear()
                         return None
             continue
 
         t = pygame.time.get_ticks() / 1000.0 - start_time
 
-        # Draw background
-        if background:
-            screen.blit(background, (0, 0))
-        else:
-            screen.fill((0, 0, 0))
+        # Draw background with lanes and judgement line
+        screen.blit(playfield, (0, 0))
+        dirty = []
 
         # Spawn notes exactly on beats
         if beat_queue and t >= beat_queue[0]:
             lane = random.randint(0, 3)
-            notes.add(lane_x[lane], -50, lane, 0.3, "normal")
+            lane_notes[lane].add(lane_x[lane], -50)
             total_notes += 1
             beat_queue.popleft()
 
         # Update and draw notes
-        for note in list(notes):
-            if not paused:
-                note.y += fall_speed
-
-            # Draw note
-            pygame.draw.rect(screen, lane_colors[note.lane],
-                             pygame.Rect(note.x - 40, note.y - 40, 80, 80), border_radius=5)
+        for lane, notes in enumerate(lane_notes):
+            notes.fall(fall_speed)
+            n = notes.count
+            for x, y in zip(notes.x[:n].tolist(), notes.y[:n].tolist()):
+                dirty.append(screen.blit(note_surfaces[lane], (x - 40, y - 40)))
 
             # Missed
-            if note.y > judgement_line + hit_window:
-                notes.remove(note)
-                combo = 0
-                health = max(0, health - 10)
-                missed_notes += 1
-
-                # Miss feedback
-                feedback_texts.append(FeedbackText("MISS", note.x, judgement_line, (255, 0, 0)))
-                for i in range(10):
-                    particles.append(Particle(note.x, judgement_line, (255, 0, 0)))
+            missed = notes.y[:n] > judgement_line + hit_window
+            if missed.any():
+                for x in notes.x[:n][missed].tolist():
+                    combo = 0
+                    health = max(0, health - 10)
+                    missed_notes += 1
+
+                    # Miss feedback
+                    feedback_texts.append(FeedbackText("MISS", x, judgement_line, (255, 0, 0)))
+                    particles.spawn(x, judgement_line, (255, 0, 0), 10)
+                notes.remove_where(missed)
 
         # Draw lane highlights
         for i in range(4):
             if lane_flash[i] > 0:
-                s = pygame.Surface((100, HEIGHT))
-                s.set_alpha(lane_flash[i])
-                s.fill(lane_colors[i])
-                screen.blit(s, (lane_x[i] - 50, 0))
+                lane_flash_surfaces[i].set_alpha(lane_flash[i])
+                dirty.append(screen.blit(lane_flash_surfaces[i], (lane_x[i] - 50, 0)))
                 lane_flash[i] = max(0, lane_flash[i] - 15)
 
-        # Draw lane separators
-        for i in range(5):
-            x = i * 150
-            pygame.draw.line(screen, (100, 100, 100), (x, 0), (x, HEIGHT), 2)
-
-        # Draw judgement line
-        pygame.draw.line(screen, (255, 255, 255), (0, judgement_line), (WIDTH, judgement_line), 4)
-
         # Particles
-        for p in particles[:]:
-            p.update()
-            p.draw()
-            if p.life <= 0:
-                particles.remove(p)
-
-        # Feedback texts
-        for ft in feedback_texts[:]:
+        particles.update()
+        dirty.extend(particles.draw())
+
+        # Feedback texts (swap finished ones with the last and pop, no list copy or remove)
+        i = 0
+        while i < len(feedback_texts):
+            ft = feedback_texts[i]
             ft.update()
-            ft.draw()
+            rect = ft.draw()
+            if rect:
+                dirty.append(rect)
             if ft.life <= 0:
-                feedback_texts.remove(ft)
+                feedback_texts[i] = feedback_texts[-1]
+                feedback_texts.pop()
+            else:
+                i += 1
 
         # Text (score/combo/health)
-        score_text = FONT.render(f"Score: {score}", True, (255, 255, 255))
-        combo_text = FONT.render(f"Combo: {combo}", True, (255, 255, 255))
+        score_text = render_text(FONT, f"Score: {score}", (255, 255, 255))
 
         # Combo color based on milestones
         combo_color = (255, 255, 255)
@@ -468,17 +600,17 @@ def game(song_path, score_bst):
         elif combo >= 10:
             combo_color = (0, 255, 255)
 
-        combo_text = FONT.render(f"Combo: {combo}", True, combo_color)
+        combo_text = render_text(FONT, f"Combo: {combo}", combo_color)
 
         # Health bar
         pygame.draw.rect(screen, (100, 0, 0), (20, 120, 200, 20))
         pygame.draw.rect(screen, (0, 255, 0), (20, 120, health * 2, 20))
-        pygame.draw.rect(screen, (255, 255, 255), (20, 120, 200, 20), 2)
+        dirty.append(pygame.draw.rect(screen, (255, 255, 255), (20, 120, 200, 20), 2))
 
-        screen.blit(score_text, (20, 20))
-        screen.blit(combo_text, (20, 70))
+        dirty.append(screen.blit(score_text, (20, 20)))
+        dirty.append(screen.blit(combo_text, (20, 70)))
 
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
                 exit()
             if event.type == pygame.KEYDOWN:
@@ -492,38 +624,51 @@ def game(song_path, score_bst):
                     lane = keys[event.key]
                     lane_flash[lane] = 100
 
-                    # Find closest note in lane using LINEAR SEARCH ALGORITHM
-                    hit_note = None
+                    # Notes in a bucket fall in spawn order, so the head is the lowest one and the
+                    # distance to the line only shrinks until the line is crossed. Start at the head
+                    # and step forward while the next note is closer (at most a note or two).
+                    notes = lane_notes[lane]
+                    n = notes.count
+                    hit_index = None
                     closest_dist = 999
 
-                    for note in notes:
-                        if note.lane == lane:
-                            dist = abs(note.y - judgement_line)
-                            if dist < closest_dist:
-                                closest_dist = dist
-                                hit_note = note
+                    if n:
+                        hit_index = 0
+                        closest_dist = abs(int(notes.y[0]) - judgement_line)
+                        while hit_index + 1 < n:
+                            dist = abs(int(notes.y[hit_index + 1]) - judgement_line)
+                            if dist >= closest_dist:
+                                break
+                            hit_index += 1
+                            closest_dist = dist
+
+                    if hit_index is not None and closest_dist < hit_window:
+                        hit_x = int(notes.x[hit_index])
 
-                    if hit_note and closest_dist < hit_window:
                         # Perfect / Good
                         if closest_dist < 20:
                             score += 300
                             perfect_hits += 1
-                            feedback_texts.append(FeedbackText("PERFECT!", hit_note.x, judgement_line, (0, 255, 255)))
+                            feedback_texts.append(FeedbackText("PERFECT!", hit_x, judgement_line, (0, 255, 255)))
                         else:
                             score += 100
                             good_hits += 1
-                            feedback_texts.append(FeedbackText("GOOD", hit_note.x, judgement_line, (255, 255, 0)))
+                            feedback_texts.append(FeedbackText("GOOD", hit_x, judgement_line, (255, 255, 0)))
 
                         combo += 1
                         max_combo = max(combo, max_combo)
 
                         # Explosion
-                        for i in range(15):
-                            particles.append(Particle(hit_note.x, judgement_line, lane_colors[lane]))
+                        particles.spawn(hit_x, judgement_line, lane_colors[lane], 15)
 
-                        notes.remove(hit_note)
+                        notes.remove(hit_index)
 
-        pygame.display.update()
+        if full_redraw:
+            pygame.display.update()
+            full_redraw = False
+        else:
+            pygame.display.update(prev_dirty + dirty)
+        prev_dirty = dirty
 
         # Game over
         if health <= 0:
@@ -539,9 +684,12 @@ def game(song_path, score_bst):
     accuracy = (total_hits / total_notes * 100) if total_notes > 0 else 0
 
     # Save high score
-    if score > score_bst.search(song_path):
-        score_bst.insert(song_path, score)
-        save_scores(score_bst)
+    if score > scores.get(song_path, 0):
+        scores[song_path] = score
+        save_scores(scores)
+
+    # Drop the per-game score/combo surfaces
+    text_cache.clear()
 
     return {
         "score": score,
@@ -556,11 +704,12 @@ def game(song_path, score_bst):
 # ============================
 # MAIN LOOP
 # ============================
-score_bst = load_scores()
+scores = load_scores()
+threading.Thread(target=warm_up_beat_tracking, daemon=True).start()
 
 while True:
-    song = song_menu(score_bst)
-    result = game(song, score_bst)
+    song = song_menu(scores)
+    result = game(song, scores)
 
     if result is None:
         continue
@@ -572,24 +721,24 @@ while True:
 
         y_pos = 150
 
-        txt = BIG_FONT.render(f"Score: {result['score']}", True, (255, 255, 0))
+        txt = render_text(BIG_FONT, f"Score: {result['score']}", (255, 255, 0))
         screen.blit(txt, (WIDTH // 2 - txt.get_width() // 2, y_pos))
         y_pos += 70
 
-        txt2 = FONT.render(f"Max Combo: {result['max_combo']}", True, (255, 255, 255))
+        txt2 = render_text(FONT, f"Max Combo: {result['max_combo']}", (255, 255, 255))
         screen.blit(txt2, (WIDTH // 2 - txt2.get_width() // 2, y_pos))
         y_pos += 50
 
-        txt3 = FONT.render(f"Accuracy: {result['accuracy']:.1f}%", True, (0, 255, 255))
+        txt3 = render_text(FONT, f"Accuracy: {result['accuracy']:.1f}%", (0, 255, 255))
         screen.blit(txt3, (WIDTH // 2 - txt3.get_width() // 2, y_pos))
         y_pos += 50
 
-        txt4 = SMALL_FONT.render(f"Perfect: {result['perfect']} | Good: {result['good']} | Missed: {result['missed']}",
-                                 True, (200, 200, 200))
+        txt4 = render_text(SMALL_FONT, f"Perfect: {result['perfect']} | Good: {result['good']} | Missed: {result['missed']}",
+                           (200, 200, 200))
         screen.blit(txt4, (WIDTH // 2 - txt4.get_width() // 2, y_pos))
         y_pos += 80
 
-        txt5 = FONT.render("Press ENTER to continue", True, (255, 255, 255))
+        txt5 = render_text(FONT, "Press ENTER to continue", (255, 255, 255))
         screen.blit(txt5, (WIDTH // 2 - txt5.get_width() // 2, y_pos))
 
         pygame.display.update()